@@ -1,7 +1,7 @@
 import asyncio
 import fractions
 import time
-from typing import Tuple
+from typing import Dict, List, Optional, Tuple
 
 import av
 import cv2
@@ -9,6 +9,41 @@ import numpy as np
 from aiortc import MediaStreamTrack
 
 
+def _yuv420p_planes(frame: av.VideoFrame) -> Tuple[np.ndarray, ...]:
+    """
+    Exposes the Y, U and V planes of a yuv420p VideoFrame as writable NumPy views.
+
+    Args:
+        frame: The yuv420p video frame.
+
+    Returns:
+        Tuple[np.ndarray, ...]: 2D views of the planes, whose rows may be padded to line_size bytes.
+    """
+    return tuple(
+        np.ndarray(
+            (plane.height, plane.width),
+            dtype=np.uint8,
+            buffer=plane,  # type: ignore
+            strides=(plane.line_size, 1),
+        )
+        for plane in frame.planes
+    )
+
+
+def _to_yuv420p(image: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """
+    Converts a BGR image to yuv420p with the same conversion the video encoder applies.
+
+    Args:
+        image: The BGR image, with even width and height.
+
+    Returns:
+        Tuple[np.ndarray, ...]: Copies of the Y, U and V planes.
+    """
+    frame = av.VideoFrame.from_ndarray(image, format="bgr24").reformat(format="yuv420p")
+    return tuple(plane.copy() for plane in _yuv420p_planes(frame))
+
+
 class Ball:
     """
     Represents a ball with a radius and color.
@@ -18,6 +53,8 @@ class Ball:
         color (Tuple[int, int, int]): The color of the ball in BGR format.
     """
 
+    __slots__ = ("radius", "color")
+
     def __init__(self, radius, color):
         """
         Initializes a new instance of the Ball class.
@@ -38,6 +75,16 @@ class BallBouncingTrack(MediaStreamTrack):
     kind = "video"
     _start: float
     _timestamp: int
+    x: int
+    y: int
+    vx: int
+    vy: int
+    _video_frame: av.VideoFrame
+    _planes: Tuple[np.ndarray, ...]
+    _background: Tuple[int, ...]
+    _sprites: Dict[Tuple[int, int], Tuple[np.ndarray, ...]]
+    _prev_bboxes: List[Optional[Tuple[slice, slice]]]
+    _drawn_position: Optional[Tuple[int, int]]
 
     def __init__(
         self,
@@ -64,24 +111,75 @@ class BallBouncingTrack(MediaStreamTrack):
         self.velocity = np.array(initial_velocity)
         self.reset_ball_position()
 
+        # A single VideoFrame is reused for every frame and drawn into in place. It is
+        # kept in yuv420p, the encoders' input format, so no per-frame conversion is needed.
+        self._video_frame = av.VideoFrame(screen_width, screen_height, "yuv420p")
+        self._planes = _yuv420p_planes(self._video_frame)
+        self._background = tuple(
+            int(plane[0, 0]) for plane in _to_yuv420p(np.zeros((2, 2, 3), np.uint8))
+        )
+        for plane, value in zip(self._planes, self._background):
+            plane[:] = value
+        self._prev_bboxes = [None, None, None]
+        self._drawn_position = None
+
+        # The ball never changes, so it is converted to YUV once, as a tile starting on
+        # even coordinates for each parity of its top-left corner, so chroma lines up.
+        size = 2 * ball_radius + 2
+        self._sprites = {}
+        for dy in (0, 1):
+            for dx in (0, 1):
+                tile = np.zeros((size, size, 3), dtype=np.uint8)
+                center = (ball_radius + dx, ball_radius + dy)
+                cv2.circle(tile, center, ball_radius, ball_color, -1)
+                self._sprites[dy, dx] = _to_yuv420p(tile)
+
+    @property
+    def coordinates(self) -> np.ndarray:
+        """The ball's position as an (x, y) NumPy array."""
+        return np.array([self.x, self.y])
+
+    @coordinates.setter
+    def coordinates(self, value) -> None:
+        self.x, self.y = int(value[0]), int(value[1])
+
+    @property
+    def position(self) -> Tuple[int, int]:
+        """The ball's position as an (x, y) tuple, without allocating an array."""
+        return self.x, self.y
+
+    @property
+    def velocity(self) -> np.ndarray:
+        """The ball's velocity in pixels per frame as an (x, y) NumPy array."""
+        return np.array([self.vx, self.vy])
+
+    @velocity.setter
+    def velocity(self, value) -> None:
+        self.vx, self.vy = int(value[0]), int(value[1])
+
     def reset_ball_position(self) -> None:
         """Resets the ball's position to the center of the screen."""
-        self.coordinates = np.array([self.width // 2, self.height // 2])
+        self.x, self.y = self.width // 2, self.height // 2
 
     def update_ball_position(self) -> None:
         """
         Updates the ball's position based on its velocity, reversing direction upon collision with the screen edges.
+
+        On collision the ball is clamped back inside the screen, so a fast ball cannot end
+        up past an edge and keep flipping its velocity there.
         """
-        self.coordinates += self.velocity
+        radius, width, height = self.ball.radius, self.width, self.height
+        x, y, vx, vy = self.x + self.vx, self.y + self.vy, self.vx, self.vy
 
         # Check for collisions with screen edges and reverse velocity
-        for i in range(2):
-            if (
-                self.coordinates[i] - self.ball.radius <= 0
-                or self.coordinates[i] + self.ball.radius
-                >= [self.width, self.height][i]
-            ):
-                self.velocity[i] *= -1
+        if not radius < x < width - radius:
+            vx = -vx
+            x = min(max(x, radius), width - radius)
+        if not radius < y < height - radius:
+            vy = -vy
+            y = min(max(y, radius), height - radius)
+
+        self.x, self.y, self.vx, self.vy = x, y, vx, vy
 
     async def next_timestamp(self) -> Tuple[int, fractions.Fraction]:
         """
@@ -104,35 +202,80 @@ class BallBouncingTrack(MediaStreamTrack):
 
         return self._timestamp, VIDEO_TIME_BASE
 
+    def draw_current_frame(self) -> av.VideoFrame:
+        """
+        Draws the ball at its current position into the reused yuv420p video frame.
+
+        Only the tiles covered by the previously drawn ball are cleared, and the ball is
+        copied in from its pre-converted tile, clipped to the screen. Nothing is redrawn
+        if the ball has not moved.
+
+        Returns:
+            av.VideoFrame: The reused video frame, overwritten by the next call.
+        """
+        x, y = self.x, self.y
+        if (x, y) == self._drawn_position:
+            return self._video_frame
+        self._drawn_position = (x, y)
+
+        planes, prev_bboxes = self._planes, self._prev_bboxes
+        for i, (plane, value) in enumerate(zip(planes, self._background)):
+            if prev_bboxes[i] is not None:
+                plane[prev_bboxes[i]] = value
+                prev_bboxes[i] = None
+
+        radius = self.ball.radius
+        top, left = (y - radius) & ~1, (x - radius) & ~1
+        tiles = self._sprites[y - radius - top, x - radius - left]
+        for i, (plane, tile, scale) in enumerate(zip(planes, tiles, (1, 2, 2))):
+            tile_top, tile_left = top // scale, left // scale
+            y0, x0 = max(tile_top, 0), max(tile_left, 0)
+            y1 = min(tile_top + tile.shape[0], plane.shape[0])
+            x1 = min(tile_left + tile.shape[1], plane.shape[1])
+            if y0 < y1 and x0 < x1:
+                bbox = (slice(y0, y1), slice(x0, x1))
+                np.copyto(
+                    plane[bbox],
+                    tile[y0 - tile_top : y1 - tile_top, x0 - tile_left : x1 - tile_left],
+                )
+                prev_bboxes[i] = bbox
+        return self._video_frame
+
     def get_current_frame(self) -> np.ndarray:
         """
-        Generates the current video frame displaying the ball at its current position.
+        Draws the ball at its current position and returns the frame converted to BGR.
+
+        This converts the whole frame, so it is meant for inspection; recv streams the
+        frame drawn by draw_current_frame without converting it.
 
         Returns:
             np.ndarray: The current video frame as a NumPy array.
         """
-        frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
-        cv2.circle(
-            frame,
-            tuple(self.coordinates.astype(int)),  # type: ignore
-            self.ball.radius,  # type: ignore
-            self.ball.color,
-            -1,
-        )
-        return frame
+        return self.draw_current_frame().to_ndarray(format="bgr24")
+
+    def _build_frame(self) -> None:
+        """Advances the ball by one frame and draws it into the reused video frame."""
+        self.update_ball_position()
+        self.draw_current_frame()
 
     async def recv(self) -> av.VideoFrame:
         """
-        Updates the ball's position, generates the next video frame, and returns it.
+        Updates the ball's position, draws the next video frame, and returns it.
+
+        Drawing runs in a worker thread so the event loop stays free for signaling and
+        the data channel. The same VideoFrame instance is returned on every call; the
+        sender has finished encoding it by the time the next frame is requested. The
+        encoder may also modify it, e.g. setting pict_type to force a keyframe after a
+        keyframe request, so such per-frame fields are reset here.
 
         Returns:
             av.VideoFrame: The next video frame.
         """
-        self.update_ball_position()
-        frame = self.get_current_frame()
+        await asyncio.to_thread(self._build_frame)
 
-        video_frame = av.VideoFrame.from_ndarray(frame, format="bgr24")
+        video_frame = self._video_frame
         pts, time_base = await self.next_timestamp()
         video_frame.pts = pts
         video_frame.time_base = time_base
+        video_frame.pict_type = av.video.frame.PictureType.NONE
         return video_frame
@@ -1,11 +1,15 @@
 import argparse
 import cv2
 import asyncio
-import json
 import logging
 import multiprocessing as mp
 import queue
-from ctypes import Structure, c_int
+import signal
+import threading
+import time
+from ctypes import c_int64
+from typing import Optional, Sequence, Tuple
+import av
 import numpy as np
 from aiortc import (
     RTCDataChannel,
@@ -14,72 +18,188 @@ from aiortc import (
 from aiortc.contrib.signaling import TcpSocketSignaling
 from aiortc.mediastreams import MediaStreamError
 from aiortc.rtcrtpreceiver import RemoteStreamTrack
+from av.video.reformatter import VideoReformatter
 
+from shared_frame_buffer import SharedFrameBuffer
 from utils import (
     add_connection_arguments,
+    add_frame_arguments,
     close_connection,
+    encode_coordinates,
     log_pc_signaling_state_changes,
     wait_for_offer_and_send_answer,
     send_offer_and_wait_for_answer,
 )
 import os
 
-DISPLAY_IMAGES = os.environ.get(
-    "DISPLAY_IMAGES", "True"
+DISPLAY_IMAGES = os.environ.get("DISPLAY_IMAGES", "True").lower() in (
+    "1",
+    "true",
+    "yes",
 )  # Set to "False" in production environment
+DISPLAY_WINDOW_NAME = "Received bouncing ball stream"
+# Minimum time in seconds between two displayed frames
+DISPLAY_INTERVAL = 0.03
+# Half the size in pixels of the window around the previous prediction searched first
+ROI_RADIUS = 50
+# Images with more pixels than this are first searched at half resolution
+SUBSAMPLE_MIN_PIXELS = 256 * 256
 
 logging.basicConfig(level=logging.INFO)
 
+# Reused for every received frame so the swscale context is kept between frames
+_reformatter = VideoReformatter()
 
-class Coordinates(Structure):
+
+def pack_coordinates(x: int, y: int) -> int:
+    """
+    Packs ball coordinates into a single signed 64-bit value, so they can be shared
+    between processes without a lock: x and y are always written and read together.
+
+    Args:
+        x: The x coordinate in pixels, as a 32-bit signed integer.
+        y: The y coordinate in pixels, as a 32-bit signed integer.
+
+    Returns:
+        The packed coordinates, with x in the high and y in the low 32 bits.
     """
-    A ctypes Structure for shared memory storage of ball coordinates.
+    return (int(x) << 32) | (int(y) & 0xFFFFFFFF)
+
+
+def unpack_coordinates(value: int) -> Tuple[int, int]:
     """
+    Unpacks ball coordinates packed by pack_coordinates.
+
+    Args:
+        value: The packed coordinates.
 
-    _fields_ = [("x", c_int), ("y", c_int)]
+    Returns:
+        The x and y coordinates in pixels.
+    """
+    y = value & 0xFFFFFFFF
+    if y & 0x80000000:
+        y -= 1 << 32
+    return value >> 32, y
+
+
+def _bright_mask(img: np.ndarray) -> np.ndarray:
+    """
+    Computes the mask of the bright area in an image: pixels where any channel is at
+    least 128 are 255, all others 0.
+    """
+    # Every channel is tested rather than a BGR2GRAY conversion, which would weight a
+    # pure blue ball at 0.114 and push it below the threshold. inRange runs over the
+    # interleaved channels in one vectorized pass, unlike a NumPy max over axis 2.
+    return cv2.bitwise_not(cv2.inRange(img, (0, 0, 0), (127, 127, 127)))
+
+
+def _mask_centroid(mask: np.ndarray) -> Optional[np.ndarray]:
+    """Computes the centroid of the nonzero pixels in a mask, or None if there are none."""
+    moments = cv2.moments(mask, binaryImage=True)
+    if moments["m00"] == 0:
+        return None
+    return np.array([moments["m10"] / moments["m00"], moments["m01"] / moments["m00"]])
+
+
+def _window_centroid(img: np.ndarray, center: Sequence[int]) -> Optional[np.ndarray]:
+    """
+    Computes the centroid of the bright area within ROI_RADIUS pixels of a point.
+
+    Returns None if the window holds no bright pixels, or if the bright area reaches an
+    edge of the window that lies inside the image, since the ball may then be cut off.
+    """
+    height, width = img.shape[:2]
+    x, y = center
+    top, bottom = max(y - ROI_RADIUS, 0), min(y + ROI_RADIUS, height)
+    left, right = max(x - ROI_RADIUS, 0), min(x + ROI_RADIUS, width)
+    mask = _bright_mask(img[top:bottom, left:right])
+    centroid = _mask_centroid(mask)
+    if centroid is None:
+        return None
+    cut_off = (
+        (top > 0 and mask[0].any())
+        or (bottom < height and mask[-1].any())
+        or (left > 0 and mask[:, 0].any())
+        or (right < width and mask[:, -1].any())
+    )
+    if cut_off:
+        return None
+    return (centroid + (left, top)).astype(int)
 
 
-def predict_coordinates(img: np.ndarray) -> np.ndarray:
+def predict_coordinates(
+    img: np.ndarray, previous: Optional[Sequence[int]] = None
+) -> np.ndarray:
     """
-    Predicts the ball's position by finding the mean coordinates of the brightest area in the image.
+    Predicts the ball's position as the centroid of the bright area in the image.
+
+    A pixel belongs to the bright area if any of its channels is at least 128. The
+    centroid is computed with a single image-moments pass and the input is not modified.
+
+    When the previous prediction is given, only the window of ROI_RADIUS pixels around
+    it is searched. Otherwise, or if the ball is not found in that window, images larger
+    than SUBSAMPLE_MIN_PIXELS are first searched on every other row and column, and the
+    window around that coarse estimate is searched at full resolution. The whole image
+    is searched at full resolution only if both fail.
 
     Args:
         img: The image array in which to predict the ball's position.
+        previous: The prediction for the previous frame, if any.
 
     Returns:
-        A numpy array containing the x and y coordinates of the predicted ball position.
+        A numpy array containing the x and y coordinates of the predicted ball position,
+        or (-1, -1) if no bright area was found.
     """
-    img[img < 128] = 0
-    img = img.sum(axis=2)
-    idxes = np.nonzero(img)
-    return np.mean(idxes, axis=1)[::-1].astype(int)
+    if previous is not None and previous[0] >= 0 and previous[1] >= 0:
+        centroid = _window_centroid(img, previous)
+        if centroid is not None:
+            return centroid
+
+    if img.shape[0] * img.shape[1] > SUBSAMPLE_MIN_PIXELS:
+        coarse = _mask_centroid(_bright_mask(img[::2, ::2]))
+        if coarse is not None:
+            centroid = _window_centroid(img, (coarse * 2).astype(int))
+            if centroid is not None:
+                return centroid
+
+    centroid = _mask_centroid(_bright_mask(img))
+    if centroid is None:
+        return np.array([-1, -1])
+    return centroid.astype(int)
 
 
 def process_frames(
-    input_frames_q: mp.Queue, shared_predicted_coordinates: mp.Value
+    frame_buffer: SharedFrameBuffer, shared_predicted_coordinates: c_int64
 ) -> None:
     """
-    Continuously processes video frames from a queue to predict ball coordinates.
+    Continuously reads the newest video frame from the shared frame buffer and predicts
+    the ball coordinates in it, until the buffer is closed.
+
+    Predictions from frames that the writer started to overwrite while they were being
+    read are discarded.
 
     Args:
-        input_frames_q: A multiprocessing queue from which video frames are received.
-        shared_predicted_coordinates: A shared memory value for storing predicted coordinates.
+        frame_buffer: The shared frame buffer from which video frames are read.
+        shared_predicted_coordinates: A shared memory value for storing predicted coordinates,
+            packed with pack_coordinates.
     """
+    previous = None
     try:
         while True:
             try:
-                frame = input_frames_q.get(timeout=5)
+                frame = frame_buffer.get(timeout=5)
             except queue.Empty:
-                logging.warning("Queue is empty")
+                logging.warning("No new frame received")
                 continue
 
             if frame is None:
                 break
-            coordinates = predict_coordinates(frame)
-            with shared_predicted_coordinates.get_lock():
-                shared_predicted_coordinates.x, shared_predicted_coordinates.y = (
-                    coordinates
-                )
+            x, y = predict_coordinates(frame, previous)
+            if frame_buffer.frame_overwritten():
+                # The frame was reused for a newer one while it was being read
+                continue
+            shared_predicted_coordinates.value = pack_coordinates(x, y)
+            previous = (x, y)
 
     except KeyboardInterrupt:
         pass
@@ -87,26 +207,102 @@ def process_frames(
         logging.info("Frame processing subprocess exited.")
 
 
+def offer_display_frame(display_q: queue.Queue, frame: Optional[np.ndarray]) -> None:
+    """
+    Replaces any frame still waiting in the display queue with a newer one.
+
+    Args:
+        display_q: A single-slot queue read by display_frames.
+        frame: The frame to display, or None to stop the display thread.
+    """
+    try:
+        display_q.get_nowait()
+    except queue.Empty:
+        pass
+    display_q.put_nowait(frame)
+
+
+def display_frames(display_q: queue.Queue) -> None:
+    """
+    Shows received frames in a window until None is received. Runs in its own thread so
+    the blocking GUI calls stay off the asyncio event loop.
+
+    At most one frame is shown every DISPLAY_INTERVAL seconds; frames offered in between
+    replace each other in the queue, so the newest one is shown next.
+
+    Args:
+        display_q: A single-slot queue from which frames to display are read.
+    """
+    cv2.namedWindow(DISPLAY_WINDOW_NAME)
+    while True:
+        frame = display_q.get()
+        if frame is None:
+            break
+        shown_at = time.monotonic()
+        cv2.imshow(DISPLAY_WINDOW_NAME, frame)
+        cv2.waitKey(1)
+        time.sleep(max(0.0, shown_at + DISPLAY_INTERVAL - time.monotonic()))
+    cv2.destroyWindow(DISPLAY_WINDOW_NAME)
+
+
+def to_bgr_view(video_frame: av.VideoFrame) -> np.ndarray:
+    """
+    Converts a decoded video frame to BGR and exposes its pixels without copying them.
+
+    Args:
+        video_frame: The decoded video frame.
+
+    Returns:
+        A (height, width, 3) view of the converted frame, whose rows may be padded to
+        line_size bytes.
+    """
+    bgr_frame = _reformatter.reformat(video_frame, format="bgr24")
+    plane = bgr_frame.planes[0]
+    return np.ndarray(
+        (plane.height, plane.width, 3),
+        dtype=np.uint8,
+        buffer=plane,  # type: ignore
+        strides=(plane.line_size, 3, 1),
+    )
+
+
 async def consume_frames(
-    track: RemoteStreamTrack, input_frames_q: mp.Queue, pc: RTCPeerConnection
+    track: RemoteStreamTrack,
+    frame_buffer: SharedFrameBuffer,
+    pc: RTCPeerConnection,
+    display_q: Optional[queue.Queue] = None,
 ) -> None:
     """
-    Consumes frames from a video track and enqueues them for processing.
+    Consumes frames from a video track and publishes them for processing.
+
+    Frames whose size does not match the shared frame buffer are logged and skipped, so
+    a server streaming at another resolution does not stop the consumer.
 
     Args:
         track: The remote video track from which frames are received.
-        input_frames_q: The multiprocessing queue to which video frames are enqueued.
+        frame_buffer: The shared frame buffer to which video frames are written.
         pc: The RTCPeerConnection associated with the track.
+        display_q: The queue of the display thread, or None if frames are not shown.
     """
+    mismatched_shape = None
     while True:
         try:
             video_frame = await track.recv()
-            logging.info("Frame received")
-            frame = video_frame.to_ndarray(format="bgr24")
-            input_frames_q.put(frame)
-            if DISPLAY_IMAGES == "True":
-                cv2.imshow("Received bouncing ball stream", frame)
-                cv2.waitKey(1)
+            logging.debug("Frame received")
+            # The YUV to BGR conversion is CPU bound, keep it off the event loop
+            frame = await asyncio.to_thread(to_bgr_view, video_frame)
+            if frame.shape != frame_buffer.shape:
+                if frame.shape != mismatched_shape:
+                    logging.error(
+                        f"Skipping frames of shape {frame.shape}, expected "
+                        f"{frame_buffer.shape}: run the client with the server's "
+                        "--width/--height"
+                    )
+                    mismatched_shape = frame.shape
+                continue
+            frame_buffer.put(frame)
+            if display_q is not None:
+                offer_display_frame(display_q, frame)
         except MediaStreamError as e:
             await asyncio.sleep(0.1)  # pausing to allow pending closing of connections
             if pc.signalingState == "closed":
@@ -115,13 +311,18 @@ async def consume_frames(
                 raise e
 
 
-def setup_remote_track(pc: RTCPeerConnection, input_frames_q: mp.Queue):
+def setup_remote_track(
+    pc: RTCPeerConnection,
+    frame_buffer: SharedFrameBuffer,
+    display_q: Optional[queue.Queue] = None,
+):
     """
     Configures handling for incoming video tracks on the PeerConnection.
 
     Args:
         pc: The RTCPeerConnection to configure.
-        input_frames_q: The queue to use for incoming video frames.
+        frame_buffer: The shared frame buffer to use for incoming video frames.
+        display_q: The queue of the display thread, or None if frames are not shown.
     """
 
     @pc.on("track")
@@ -130,11 +331,11 @@ def setup_remote_track(pc: RTCPeerConnection, input_frames_q: mp.Queue):
             logging.error(f"Recieved track of incompatible kind {track.kind}")
             return
         logging.info("Recieved video track")
-        asyncio.ensure_future(consume_frames(track, input_frames_q, pc))
+        asyncio.ensure_future(consume_frames(track, frame_buffer, pc, display_q))
 
 
 def create_datachannel(
-    pc: RTCPeerConnection, shared_predicted_coordinates: mp.Value
+    pc: RTCPeerConnection, shared_predicted_coordinates: c_int64
 ) -> RTCDataChannel:
     """
     Creates and configures a data channel for sending predicted ball coordinates.
@@ -159,25 +360,33 @@ def create_datachannel(
 
 
 async def send_predicted_coordinates(
-    channel: RTCDataChannel, shared_predicted_coordinates: mp.Value, pc: RTCDataChannel
+    channel: RTCDataChannel,
+    shared_predicted_coordinates: c_int64,
+    pc: RTCDataChannel,
 ) -> None:
     """
-    Periodically sends the predicted ball coordinates over the data channel.
+    Periodically sends the predicted ball coordinates over the data channel, packed with
+    encode_coordinates. A prediction equal to the last one sent is not sent again.
 
     Args:
         channel: The RTCDataChannel through which the coordinates are sent.
-        shared_predicted_coordinates: The shared memory object from which coordinates are read.
+        shared_predicted_coordinates: The shared memory value from which packed coordinates are read.
     """
+    last_sent = None
     while True:
         await asyncio.sleep(0.1)
         if channel.readyState != "open":
             logging.info("Channel closed")
             break
-        x, y = shared_predicted_coordinates.x, shared_predicted_coordinates.y
+        packed = shared_predicted_coordinates.value
+        if packed == last_sent:
+            continue
+        x, y = unpack_coordinates(packed)
         if x == -1 or y == -1:
             continue
-        logging.info(f"Sending predicted ball coordinates: {x}, {y}")
-        channel.send(json.dumps((x, y)))
+        logging.debug("Sending predicted ball coordinates: %d, %d", x, y)
+        channel.send(encode_coordinates(x, y))
+        last_sent = packed
 
 
 async def run_client(
@@ -185,8 +394,9 @@ async def run_client(
     media_signaling: TcpSocketSignaling,
     data_pc: RTCPeerConnection,
     data_signaling: TcpSocketSignaling,
-    input_frames_q: mp.Queue,
-    shared_predicted_coordinates: mp.Value,
+    frame_buffer: SharedFrameBuffer,
+    shared_predicted_coordinates: c_int64,
+    display_q: Optional[queue.Queue] = None,
 ):
     """
     Sets up the client to handle WebRTC connections for video streaming and data communication.
@@ -196,11 +406,12 @@ async def run_client(
         media_signaling: The signaling channel for the media connection.
         data_pc: The PeerConnection for data communication.
         data_signaling: The signaling channel for the data connection.
-        input_frames_q: The queue to use for incoming video frames.
+        frame_buffer: The shared frame buffer to use for incoming video frames.
         shared_predicted_coordinates: The shared memory object used to store/read the predicted coordinates.
+        display_q: The queue of the display thread, or None if frames are not shown.
     """
     try:
-        setup_remote_track(media_pc, input_frames_q)
+        setup_remote_track(media_pc, frame_buffer, display_q)
         await wait_for_offer_and_send_answer(media_pc, media_signaling)
 
         create_datachannel(data_pc, shared_predicted_coordinates)
@@ -212,59 +423,109 @@ async def run_client(
 
 
 async def cleanup(
-    media_pc, data_pc, media_signaling, data_signaling, input_frames_q, process_a
+    media_pc, data_pc, media_signaling, data_signaling, frame_buffer, process_a
 ):
     logging.info("Cleaning up")
-    input_frames_q.put(None)
+    frame_buffer.put(None)
     process_a.join()
 
-    await close_connection(media_pc, media_signaling)
-    await close_connection(data_pc, data_signaling)
+    await asyncio.gather(
+        close_connection(media_pc, media_signaling),
+        close_connection(data_pc, data_signaling),
+    )
+
+
+async def main(
+    args: argparse.Namespace,
+    frame_buffer: SharedFrameBuffer,
+    shared_predicted_coordinates: c_int64,
+    process_a: mp.Process,
+    display_q: Optional[queue.Queue],
+) -> None:
+    """
+    Creates the peer connections and signaling channels, runs the client on a single
+    event loop, and cleans up when it finishes or is interrupted.
+
+    Args:
+        args: The parsed command line arguments.
+        frame_buffer: The shared frame buffer to use for incoming video frames.
+        shared_predicted_coordinates: The shared memory object used to store/read the predicted coordinates.
+        process_a: The frame processing subprocess, stopped during cleanup.
+        display_q: The queue of the display thread, or None if frames are not shown.
+    """
+    media_pc = RTCPeerConnection()
+    data_pc = RTCPeerConnection()
+    log_pc_signaling_state_changes(media_pc, "Media")
+    log_pc_signaling_state_changes(data_pc, "Data")
+    media_signaling = TcpSocketSignaling(args.host, args.media_port)
+    data_signaling = TcpSocketSignaling("0.0.0.0", args.data_port)
+
+    try:
+        await run_client(
+            media_pc,
+            media_signaling,
+            data_pc,
+            data_signaling,
+            frame_buffer,
+            shared_predicted_coordinates,
+            display_q,
+        )
+    finally:
+        await cleanup(
+            media_pc,
+            data_pc,
+            media_signaling,
+            data_signaling,
+            frame_buffer,
+            process_a,
+        )
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     add_connection_arguments(parser)
+    add_frame_arguments(parser)
+    parser.add_argument(
+        "--no-display", action="store_true", help="Do not show the received frames"
+    )
     args = parser.parse_args()
 
-    input_frames_q = mp.Queue(maxsize=100)
-    shared_predicted_coordinates = mp.Value(Coordinates, -1, -1, lock=True)
+    frame_buffer = SharedFrameBuffer((args.height, args.width, 3))
+    shared_predicted_coordinates = mp.RawValue(c_int64, pack_coordinates(-1, -1))
     process_a = mp.Process(
         target=process_frames,
         name="process_a",
-        args=(input_frames_q, shared_predicted_coordinates),
+        args=(frame_buffer, shared_predicted_coordinates),
     )
+    # Ctrl-C reaches the whole process group; the subprocess ignores it and is stopped
+    # through the frame buffer during cleanup, instead of being interrupted while
+    # waiting on the buffer's shared event, which would leave that event unusable.
+    sigint_handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
     process_a.start()
+    signal.signal(signal.SIGINT, sigint_handler)
 
-    media_pc = RTCPeerConnection()
-    data_pc = RTCPeerConnection()
-    log_pc_signaling_state_changes(media_pc, "Media")
-    log_pc_signaling_state_changes(data_pc, "Data")
-    media_signaling = TcpSocketSignaling(args.host, args.media_port)
-    data_signaling = TcpSocketSignaling("0.0.0.0", args.data_port)
+    display_q = None
+    if DISPLAY_IMAGES and not args.no_display:
+        display_q = queue.Queue(maxsize=1)
+        display_thread = threading.Thread(
+            target=display_frames, name="display", args=(display_q,), daemon=True
+        )
+        display_thread.start()
 
-    loop = asyncio.get_event_loop()
     try:
-        loop.run_until_complete(
-            run_client(
-                media_pc,
-                media_signaling,
-                data_pc,
-                data_signaling,
-                input_frames_q,
+        asyncio.run(
+            main(
+                args,
+                frame_buffer,
                 shared_predicted_coordinates,
+                process_a,
+                display_q,
             )
         )
     except KeyboardInterrupt:
         pass
     finally:
-        loop.run_until_complete(
-            cleanup(
-                media_pc,
-                data_pc,
-                media_signaling,
-                data_signaling,
-                input_frames_q,
-                process_a,
-            )
-        )
+        frame_buffer.close()
+        if display_q is not None:
+            offer_display_frame(display_q, None)
+            display_thread.join()
@@ -2,15 +2,19 @@ import argparse
 import asyncio
 import json
 import logging
+import math
+import struct
+from typing import Sequence, Union
 
-import numpy as np
 from aiortc import RTCPeerConnection, RTCDataChannel
 from aiortc.contrib.signaling import TcpSocketSignaling
 
 from ball_bouncing_track import BallBouncingTrack
 from utils import (
     add_connection_arguments,
+    add_frame_arguments,
     close_connection,
+    decode_coordinates,
     log_pc_signaling_state_changes,
     send_offer_and_wait_for_answer,
     wait_for_offer_and_send_answer,
@@ -19,18 +23,35 @@ from utils import (
 logging.basicConfig(level=logging.INFO)
 
 
-def distance_between(pred_coordinates: np.array, actual_coordinates: np.array) -> float:
+def distance_between(
+    pred_coordinates: Sequence[float], actual_coordinates: Sequence[float]
+) -> float:
     """Calculate the Euclidean distance between two points."""
-    return np.linalg.norm(pred_coordinates - actual_coordinates)
+    return math.hypot(
+        pred_coordinates[0] - actual_coordinates[0],
+        pred_coordinates[1] - actual_coordinates[1],
+    )
 
 
-def on_message(message: str, actual_coordinates: np.array) -> None:
-    """Handles incoming messages on the data channel."""
+def on_message(
+    message: Union[bytes, str], actual_coordinates: Sequence[float]
+) -> None:
+    """
+    Handles incoming messages on the data channel.
+
+    Predictions arrive packed by encode_coordinates; JSON text messages from older
+    clients are still accepted.
+    """
     try:
-        pred_coordinates = np.array(json.loads(message))
+        if isinstance(message, bytes):
+            pred_coordinates = decode_coordinates(message)
+        else:
+            pred_coordinates = tuple(json.loads(message))
+            if len(pred_coordinates) != 2:
+                raise ValueError(f"Expected 2 coordinates, got {pred_coordinates}")
         error_distance = distance_between(pred_coordinates, actual_coordinates)
         logging.info(f"Prediction Error (distance): {error_distance}")
-    except (json.JSONDecodeError, ValueError) as e:
+    except (json.JSONDecodeError, ValueError, TypeError, struct.error) as e:
         logging.error(f"Invalid data received on data channel: {e}")
 
 
@@ -40,7 +61,7 @@ def setup_data_channel(pc: RTCPeerConnection, track: BallBouncingTrack) -> None:
     @pc.on("datachannel")
     def on_datachannel(channel: RTCDataChannel):
         logging.info(f"Channel {channel.label} created ")
-        channel.on("message", lambda msg: on_message(msg, track.coordinates))
+        channel.on("message", lambda msg: on_message(msg, track.position))
 
 
 async def run_server(
@@ -48,6 +69,8 @@ async def run_server(
     media_signaling: TcpSocketSignaling,
     data_pc: RTCPeerConnection,
     data_signaling: TcpSocketSignaling,
+    width: int = 640,
+    height: int = 480,
 ) -> None:
     """
     Sets up the server to handle WebRTC connections for video streaming and data communication.
@@ -57,10 +80,12 @@ async def run_server(
         media_signaling: The signaling channel for the media connection.
         data_pc: The PeerConnection for data communication.
         data_signaling: The signaling channel for the data connection.
+        width: The width of the streamed video frames in pixels.
+        height: The height of the streamed video frames in pixels.
     """
 
     try:
-        track = BallBouncingTrack(640, 480)
+        track = BallBouncingTrack(width, height)
         media_pc.addTrack(track)
         await send_offer_and_wait_for_answer(media_pc, media_signaling)
 
@@ -79,7 +104,7 @@ async def cleanup(
     data_signaling,
 ):
     """
-    Closes all active connections and signaling channels in an orderly manner.
+    Closes the media and data connections and their signaling channels concurrently.
 
     Args:
         media_pc: The PeerConnection for media streaming.
@@ -89,15 +114,20 @@ async def cleanup(
     """
 
     logging.info("Cleaning up")
-    await close_connection(media_pc, media_signaling)
-    await close_connection(data_pc, data_signaling)
+    await asyncio.gather(
+        close_connection(media_pc, media_signaling),
+        close_connection(data_pc, data_signaling),
+    )
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
-    add_connection_arguments(parser)
-    args = parser.parse_args()
+async def main(args: argparse.Namespace) -> None:
+    """
+    Creates the peer connections and signaling channels, runs the server on a single
+    event loop, and cleans up when it finishes or is interrupted.
 
+    Args:
+        args: The parsed command line arguments.
+    """
     media_pc = RTCPeerConnection()
     data_pc = RTCPeerConnection()
     log_pc_signaling_state_changes(media_pc, "Media")
@@ -105,21 +135,31 @@ if __name__ == "__main__":
     media_signaling = TcpSocketSignaling("0.0.0.0", args.media_port)
     data_signaling = TcpSocketSignaling(args.host, args.data_port)
 
-  
-
-    loop = asyncio.get_event_loop()
     try:
-        loop.run_until_complete(
-            run_server(media_pc, media_signaling, data_pc, data_signaling)
+        await run_server(
+            media_pc,
+            media_signaling,
+            data_pc,
+            data_signaling,
+            args.width,
+            args.height,
         )
-    except KeyboardInterrupt:
-        pass
     finally:
-        loop.run_until_complete(
-            cleanup(
-                media_pc,
-                data_pc,
-                media_signaling,
-                data_signaling,
-            )
+        await cleanup(
+            media_pc,
+            data_pc,
+            media_signaling,
+            data_signaling,
         )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_connection_arguments(parser)
+    add_frame_arguments(parser)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        pass
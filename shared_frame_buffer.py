@@ -0,0 +1,134 @@
+import multiprocessing as mp
+import queue
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class SharedFrameBuffer:
+    """
+    A double buffer of video frames in shared memory, used to hand frames to another
+    process without pickling them through a pipe.
+
+    The writer copies each frame into the back buffer and then publishes it as the front
+    buffer, so the reader always sees the most recent complete frame. Frames that are
+    not read before the next one arrives are dropped. Frames are numbered by a write
+    sequence counter, which lets the reader detect that the writer has started to reuse
+    the buffer of a frame it is still reading. The counters are only accessed under a
+    shared lock, whose acquire and release act as memory barriers, so the copy into a
+    buffer is ordered with respect to them on any CPU. The interface mirrors the parts of
+    multiprocessing.Queue used by the client: `put(None)` signals the reader to stop.
+    """
+
+    def __init__(self, shape: Tuple[int, int, int]):
+        """
+        Initializes a new instance of the SharedFrameBuffer class.
+
+        Args:
+            shape: The (height, width, channels) shape of the uint8 frames to be shared.
+        """
+        self.shape = tuple(shape)
+        self._frame_size = int(np.prod(self.shape))
+        self._shm = shared_memory.SharedMemory(create=True, size=2 * self._frame_size)
+        self._owner = True
+        # Number of the last published frame and of the frame being written; frame n
+        # is stored in buffer n % 2
+        self._published_seq = mp.RawValue("Q", 0)
+        self._writing_seq = mp.RawValue("Q", 0)
+        self._seq_lock = mp.Lock()
+        self._read_seq = 0
+        self._new_frame = mp.Event()
+        self._closed = mp.Event()
+        self._buffers: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state["_owner"] = False
+        state["_buffers"] = None
+        return state
+
+    @property
+    def buffers(self) -> Tuple[np.ndarray, np.ndarray]:
+        """The two frame buffers as NumPy views into the shared memory block."""
+        if self._buffers is None:
+            self._buffers = tuple(  # type: ignore
+                np.ndarray(
+                    self.shape,
+                    dtype=np.uint8,
+                    buffer=self._shm.buf,
+                    offset=i * self._frame_size,
+                )
+                for i in range(2)
+            )
+        return self._buffers  # type: ignore
+
+    def put(self, frame: Optional[np.ndarray]) -> None:
+        """
+        Copies a frame into the back buffer and publishes it as the front buffer.
+
+        Args:
+            frame: The frame to publish, or None to signal the reader to stop.
+
+        Raises:
+            ValueError: If the frame does not match the shape of the buffer.
+        """
+        if frame is None:
+            self._closed.set()
+            self._new_frame.set()
+            return
+
+        if frame.shape != self.shape:
+            raise ValueError(
+                f"Frame of shape {frame.shape} does not fit buffer of shape {self.shape}"
+            )
+        with self._seq_lock:
+            seq = self._published_seq.value + 1
+            self._writing_seq.value = seq
+        np.copyto(self.buffers[seq % 2], frame)
+        with self._seq_lock:
+            self._published_seq.value = seq
+        self._new_frame.set()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[np.ndarray]:
+        """
+        Waits for a new frame and returns a view of the current front buffer.
+
+        The writer reuses the buffer once it has published two more frames; use
+        frame_overwritten to check that the view was not modified while it was read.
+
+        Args:
+            timeout: The maximum time to wait for a new frame in seconds.
+
+        Returns:
+            The most recent frame, or None if the writer signaled the reader to stop.
+
+        Raises:
+            queue.Empty: If no new frame was published within the timeout.
+        """
+        if not self._new_frame.wait(timeout):
+            raise queue.Empty
+        self._new_frame.clear()
+        if self._closed.is_set():
+            return None
+        with self._seq_lock:
+            self._read_seq = self._published_seq.value
+        return self.buffers[self._read_seq % 2]
+
+    def frame_overwritten(self) -> bool:
+        """
+        Checks whether the writer has started to overwrite the frame last returned by get,
+        in which case anything computed from it may be based on a torn frame.
+
+        Returns:
+            True if the frame's buffer is being or has been reused for a newer frame.
+        """
+        with self._seq_lock:
+            return self._writing_seq.value >= self._read_seq + 2
+
+    def close(self) -> None:
+        """Releases the shared memory block, unlinking it if this instance created it."""
+        self._buffers = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
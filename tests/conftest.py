@@ -34,6 +34,7 @@ def mock_queue():
 def mock_track():
     mock_track = MagicMock()
     mock_track.coordinates = [0, 0]
+    mock_track.position = (0, 0)
     return mock_track
 
 
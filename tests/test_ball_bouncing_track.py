@@ -2,6 +2,7 @@ import fractions
 from unittest.mock import patch
 
 import av
+import cv2
 import numpy as np
 import pytest
 
@@ -18,6 +19,12 @@ def test_ball_initialization():
     assert ball.color == test_color
 
 
+def as_encoded(image):
+    """Round-trips a BGR image through the yuv420p conversion the encoders apply."""
+    frame = av.VideoFrame.from_ndarray(image, format="bgr24")
+    return frame.reformat(format="yuv420p").to_ndarray(format="bgr24")
+
+
 @pytest.fixture
 def default_bouncing_ball_track():
     return BallBouncingTrack(screen_width=800, screen_height=600)
@@ -32,6 +39,10 @@ def test_initialization(default_bouncing_ball_track):
     assert np.array_equal(track.coordinates, np.array([400, 300]))
 
 
+def test_position(default_bouncing_ball_track):
+    assert default_bouncing_ball_track.position == (400, 300)
+
+
 def test_reset_ball_position(default_bouncing_ball_track):
     track = default_bouncing_ball_track
     track.coordinates = np.array([100, 100])
@@ -90,3 +101,94 @@ async def test_next_timestamp_subsequent_calls():
 
     expected_timestamp_increase = int((1 / 30) * 90000)
     assert timestamp == expected_timestamp_increase
+
+
+def test_get_current_frame_clears_previous_ball(default_bouncing_ball_track):
+    track = default_bouncing_ball_track
+    first = track.get_current_frame().copy()
+
+    track.coordinates = np.array([100, 100])
+    frame = track.get_current_frame()
+
+    assert not frame[300, 400].any()
+    assert frame[100, 100].any()
+    assert first[300, 400].any()
+
+
+@pytest.mark.asyncio
+async def test_recv_draws_into_reused_video_frame(default_bouncing_ball_track):
+    track = default_bouncing_ball_track
+    first = await track.recv()
+    with patch("ball_bouncing_track.asyncio.sleep"):
+        second = await track.recv()
+
+    assert first is second
+    assert second.format.name == "yuv420p"
+    x, y = track.coordinates
+    color = as_encoded(np.full((2, 2, 3), track.ball.color, dtype=np.uint8))[0, 0]
+    assert np.array_equal(second.to_ndarray(format="bgr24")[y, x], color)
+
+
+@pytest.mark.asyncio
+async def test_recv_resets_forced_keyframe(default_bouncing_ball_track):
+    track = default_bouncing_ball_track
+    frame = await track.recv()
+    # The VP8 encoder forces a keyframe by setting pict_type on the frame it encodes
+    frame.pict_type = av.video.frame.PictureType.I
+
+    with patch("ball_bouncing_track.asyncio.sleep"):
+        frame = await track.recv()
+
+    assert frame.pict_type == av.video.frame.PictureType.NONE
+
+
+def test_update_ball_position_bounces_off_top_edge(default_bouncing_ball_track):
+    track = default_bouncing_ball_track
+    track.coordinates = (400, 25)
+
+    track.update_ball_position()
+
+    assert (track.x, track.y) == (415, 20)
+    assert np.array_equal(track.velocity, np.array([15, 10]))
+
+
+def test_update_ball_position_clamps_fast_ball(default_bouncing_ball_track):
+    track = default_bouncing_ball_track
+    track.coordinates = (770, 300)
+    track.velocity = (100, 0)
+
+    track.update_ball_position()
+    assert (track.x, track.velocity[0]) == (780, -100)
+
+    track.update_ball_position()
+    assert (track.x, track.velocity[0]) == (680, -100)
+
+
+@pytest.mark.parametrize(
+    "coordinates", [(400, 300), (401, 301), (5, 590), (-30, 100), (790, -15)]
+)
+def test_get_current_frame_matches_drawn_circle(
+    default_bouncing_ball_track, coordinates
+):
+    track = default_bouncing_ball_track
+    track.get_current_frame()
+    track.coordinates = coordinates
+
+    expected = np.zeros((600, 800, 3), dtype=np.uint8)
+    cv2.circle(expected, coordinates, track.ball.radius, track.ball.color, -1)
+
+    assert np.array_equal(track.get_current_frame(), as_encoded(expected))
+
+
+def test_get_current_frame_skips_redraw_when_ball_is_still():
+    track = BallBouncingTrack(
+        screen_width=800, screen_height=600, initial_velocity=(0, 0)
+    )
+    track.get_current_frame()
+    track.update_ball_position()
+
+    with patch("ball_bouncing_track.np.copyto") as mock_copyto:
+        frame = track.get_current_frame()
+
+    mock_copyto.assert_not_called()
+    assert frame[300, 400].any()
@@ -1,9 +1,9 @@
 import asyncio
-import json
 import multiprocessing as mp
 import queue
 from unittest.mock import AsyncMock, MagicMock, Mock, patch
 
+import av
 import cv2
 import numpy as np
 import pytest
@@ -15,12 +15,19 @@ from client import (
     cleanup,
     consume_frames,
     create_datachannel,
+    display_frames,
+    offer_display_frame,
+    pack_coordinates,
     predict_coordinates,
     process_frames,
     send_predicted_coordinates,
     run_client,
     setup_remote_track,
+    to_bgr_view,
+    unpack_coordinates,
 )
+from shared_frame_buffer import SharedFrameBuffer
+from utils import encode_coordinates
 
 
 def generate_test_image_and_coordinates():
@@ -46,71 +53,279 @@ def test_predict_coordinates():
     assert tuple(result.tolist()) == coordinates
 
 
+def test_predict_coordinates_does_not_modify_image():
+    test_image, _ = generate_test_image_and_coordinates()
+    test_image[0, 0] = (10, 10, 10)
+    original = test_image.copy()
+
+    predict_coordinates(test_image)
+
+    assert np.array_equal(test_image, original)
+
+
+def draw_ball(coordinates, radius=20, size=(480, 640)):
+    img = np.zeros((*size, 3), dtype=np.uint8)
+    cv2.circle(img, coordinates, radius, (0, 0, 255), -1)
+    return img
+
+
+@pytest.mark.parametrize(
+    "coordinates, previous",
+    [
+        ((300, 200), (310, 190)),  # ball inside the window
+        ((300, 200), (600, 50)),  # ball moved outside the window
+        ((300, 200), (345, 200)),  # ball cut off by the window edge
+        ((10, 470), (5, 475)),  # window clipped by the image corner
+    ],
+)
+def test_predict_coordinates_with_previous_matches_full_search(coordinates, previous):
+    img = draw_ball(coordinates)
+
+    result = predict_coordinates(img, previous)
+
+    assert np.array_equal(result, predict_coordinates(img))
+
+
+def test_predict_coordinates_searches_window_around_previous():
+    img = draw_ball((300, 200))
+    img[0, 0] = 255  # a stray bright pixel outside the window is ignored
+
+    result = predict_coordinates(img, (310, 190))
+
+    assert tuple(result.tolist()) == (300, 200)
+
+
+@pytest.mark.parametrize("coordinates", [(300, 200), (10, 470), (631, 3)])
+def test_predict_coordinates_in_large_image(coordinates):
+    img = draw_ball(coordinates)
+    moments = cv2.moments(img.max(axis=2), binaryImage=True)
+    expected = (
+        int(moments["m10"] / moments["m00"]),
+        int(moments["m01"] / moments["m00"]),
+    )
+
+    result = predict_coordinates(img)
+
+    assert tuple(result.tolist()) == expected
+
+
+def test_predict_coordinates_finds_ball_missed_by_subsampling():
+    img = np.zeros((480, 640, 3), dtype=np.uint8)
+    img[101, 201] = 255
+
+    result = predict_coordinates(img)
+
+    assert tuple(result.tolist()) == (201, 101)
+
+
+def test_predict_coordinates_without_ball():
+    result = predict_coordinates(np.zeros((100, 100, 3), dtype=np.uint8))
+    assert tuple(result.tolist()) == (-1, -1)
+
+
 @pytest.fixture
 def mock_value():
-    """Fixture to create a mock shared value."""
-    mock_val = Mock()
-    mock_val.get_lock = Mock()
-    mock_val.get_lock.return_value = MagicMock()
+    """Fixture to create a mock lock-free shared value."""
+    return Mock(spec=["value"])
+
 
-    return mock_val
+@pytest.fixture
+def mock_frame_buffer():
+    """Fixture to create a mock shared frame buffer whose frames are never overwritten."""
+    frame_buffer = MagicMock(spec=SharedFrameBuffer)
+    frame_buffer.frame_overwritten.return_value = False
+    return frame_buffer
 
 
-def test_process_frames_empty_queue(mock_queue, mock_value):
-    """Test process_frames with an empty queue, expecting a log for an empty queue."""
-    mock_queue().get.side_effect = [queue.Empty, None]
+def test_process_frames_empty_queue(mock_frame_buffer, mock_value):
+    """Test process_frames with no new frame, expecting a warning to be logged."""
+    mock_frame_buffer.get.side_effect = [queue.Empty, None]
 
     with patch("client.logging.warning") as mock_log_warning:
-        process_frames(mock_queue(), mock_value)
+        process_frames(mock_frame_buffer, mock_value)
 
-        mock_log_warning.assert_called_once_with("Queue is empty")
+        mock_log_warning.assert_called_once_with("No new frame received")
 
 
-def test_process_frames_terminates_on_none(mock_queue, mock_value):
+def test_process_frames_terminates_on_none(mock_frame_buffer, mock_value):
     """Test process_frames terminates processing when None is received."""
-    mock_queue().get.side_effect = [None]  # Simulate receiving a termination signal
+    mock_frame_buffer.get.side_effect = [None]  # Simulate receiving a termination signal
 
     with patch("client.logging.info") as mock_log_info:
-        process_frames(mock_queue(), mock_value)
+        process_frames(mock_frame_buffer, mock_value)
         mock_log_info.assert_called_once_with("Frame processing subprocess exited.")
 
 
-def test_process_frames_updates_coordinates(mock_queue, mock_value, mocker):
+def test_process_frames_updates_coordinates(mock_frame_buffer, mock_value, mocker):
     """Test process_frames updates coordinates correctly."""
     frame_mock = Mock()
     predicted_coordinates = (100, 200)
     mocker.patch("client.predict_coordinates", return_value=predicted_coordinates)
-    mock_queue().get.side_effect = [
+    mock_frame_buffer.get.side_effect = [
         frame_mock,
         None,
     ]
 
-    process_frames(mock_queue(), mock_value)
+    process_frames(mock_frame_buffer, mock_value)
+
+    assert unpack_coordinates(mock_value.value) == predicted_coordinates
+
+
+def test_process_frames_discards_prediction_from_overwritten_frame(
+    mock_frame_buffer, mock_value, mocker
+):
+    mocker.patch("client.predict_coordinates", side_effect=[(100, 200), (110, 190)])
+    mock_frame_buffer.get.side_effect = ["frame1", "frame2", None]
+    mock_frame_buffer.frame_overwritten.side_effect = [False, True]
+
+    process_frames(mock_frame_buffer, mock_value)
+
+    assert unpack_coordinates(mock_value.value) == (100, 200)
+
+
+def test_process_frames_passes_previous_prediction(mock_frame_buffer, mock_value, mocker):
+    mock_predict = mocker.patch(
+        "client.predict_coordinates", side_effect=[(100, 200), (110, 190)]
+    )
+    mock_frame_buffer.get.side_effect = ["frame1", "frame2", None]
+
+    process_frames(mock_frame_buffer, mock_value)
+
+    assert mock_predict.call_args_list == [
+        (("frame1", None),),
+        (("frame2", (100, 200)),),
+    ]
+
+
+@pytest.mark.parametrize("coordinates", [(100, 200), (-1, -1), (-30, 7), (640, -5)])
+def test_pack_coordinates_round_trip(coordinates):
+    assert unpack_coordinates(pack_coordinates(*coordinates)) == coordinates
+
 
-    assert mock_value.x == predicted_coordinates[0]
-    assert mock_value.y == predicted_coordinates[1]
+def test_pack_coordinates_fits_shared_int64():
+    shared = mp.RawValue("q", pack_coordinates(-1, -1))
+    assert unpack_coordinates(shared.value) == (-1, -1)
+
+
+FRAME_SHAPE = (480, 640, 3)
+mock_frame = Mock(shape=FRAME_SHAPE)
 
 
 @pytest.mark.asyncio
-async def test_consume_frames_receives_and_puts_frames(mocker, mock_pc):
+@patch("client.to_bgr_view", return_value=mock_frame)
+async def test_consume_frames_receives_and_puts_frames(mock_to_bgr_view, mock_pc):
     mock_track = AsyncMock(spec=RemoteStreamTrack)
-    mock_input_frames_q = MagicMock()
+    mock_input_frames_q = MagicMock(shape=FRAME_SHAPE)
 
     mock_video_frame = MagicMock()
-    mock_video_frame.to_ndarray.return_value = "mock_frame"
 
     mock_track.recv.side_effect = [
         mock_video_frame,
         asyncio.CancelledError(),
     ]
 
-    mocker.patch("client.cv2.imshow")
-    mocker.patch("client.cv2.waitKey", return_value=None)
-
     with pytest.raises(asyncio.CancelledError):
         await consume_frames(mock_track, mock_input_frames_q, mock_pc)
 
-    mock_input_frames_q.put.assert_called_with("mock_frame")
+    mock_to_bgr_view.assert_called_once_with(mock_video_frame)
+    mock_input_frames_q.put.assert_called_with(mock_frame)
+
+
+@pytest.mark.asyncio
+@patch("client.to_bgr_view", return_value=mock_frame)
+async def test_consume_frames_offers_frames_for_display(mock_to_bgr_view, mock_pc):
+    mock_track = AsyncMock(spec=RemoteStreamTrack)
+    mock_video_frame = MagicMock()
+    mock_track.recv.side_effect = [mock_video_frame, asyncio.CancelledError()]
+    display_q = queue.Queue(maxsize=1)
+
+    with pytest.raises(asyncio.CancelledError):
+        await consume_frames(
+            mock_track, MagicMock(shape=FRAME_SHAPE), mock_pc, display_q
+        )
+
+    assert display_q.get_nowait() is mock_frame
+
+
+@pytest.mark.asyncio
+@patch("client.logging.error")
+@patch("client.to_bgr_view")
+async def test_consume_frames_skips_frames_of_other_size(
+    mock_to_bgr_view, mock_log_error, mock_pc
+):
+    small_frame = np.zeros((360, 640, 3), dtype=np.uint8)
+    mock_to_bgr_view.side_effect = [small_frame, small_frame, mock_frame]
+    mock_track = AsyncMock(spec=RemoteStreamTrack)
+    mock_track.recv.side_effect = [
+        MagicMock(),
+        MagicMock(),
+        MagicMock(),
+        asyncio.CancelledError(),
+    ]
+    frame_buffer = MagicMock(shape=FRAME_SHAPE)
+    display_q = queue.Queue(maxsize=1)
+
+    with pytest.raises(asyncio.CancelledError):
+        await consume_frames(mock_track, frame_buffer, mock_pc, display_q)
+
+    frame_buffer.put.assert_called_once_with(mock_frame)
+    assert display_q.get_nowait() is mock_frame
+    mock_log_error.assert_called_once()
+    assert "--width/--height" in mock_log_error.call_args.args[0]
+
+
+def test_to_bgr_view_matches_to_ndarray():
+    img, _ = generate_test_image_and_coordinates()
+    video_frame = av.VideoFrame.from_ndarray(img, format="bgr24").reformat(
+        format="yuv420p"
+    )
+
+    frame = to_bgr_view(video_frame)
+
+    assert frame.shape == (100, 100, 3)
+    assert np.array_equal(frame, video_frame.to_ndarray(format="bgr24"))
+
+
+def test_offer_display_frame_replaces_pending_frame():
+    display_q = queue.Queue(maxsize=1)
+
+    offer_display_frame(display_q, "old_frame")
+    offer_display_frame(display_q, "new_frame")
+
+    assert display_q.get_nowait() == "new_frame"
+    assert display_q.empty()
+
+
+@patch("client.time.sleep")
+@patch("client.cv2")
+def test_display_frames_shows_frames_until_none(mock_cv2, mock_sleep):
+    display_q = queue.Queue()
+    display_q.put("mock_frame")
+    display_q.put(None)
+
+    display_frames(display_q)
+
+    mock_cv2.namedWindow.assert_called_once_with("Received bouncing ball stream")
+    mock_cv2.imshow.assert_called_once_with(
+        "Received bouncing ball stream", "mock_frame"
+    )
+    mock_cv2.waitKey.assert_called_once_with(1)
+    mock_cv2.destroyWindow.assert_called_once_with("Received bouncing ball stream")
+
+
+@patch("client.time.sleep")
+@patch("client.time.monotonic", side_effect=[10.0, 10.01, 10.05, 10.09])
+@patch("client.cv2")
+def test_display_frames_throttles_display(mock_cv2, mock_monotonic, mock_sleep):
+    display_q = queue.Queue()
+    display_q.put("frame1")
+    display_q.put("frame2")
+    display_q.put(None)
+
+    display_frames(display_q)
+
+    assert mock_sleep.call_args_list[0].args[0] == pytest.approx(0.02)
+    assert mock_sleep.call_args_list[1].args[0] == 0.0
 
 
 @pytest.mark.asyncio
@@ -143,7 +358,7 @@ async def test_setup_remote_track_with_video_track(mock_consume_frames):
     await on_track_handler(mock_track)
 
     mock_consume_frames.assert_called_once_with(
-        mock_track, mock_input_frames_q, mock_pc
+        mock_track, mock_input_frames_q, mock_pc, None
     )
 
 
@@ -204,15 +419,15 @@ async def test_create_datachannel(
 
 
 @pytest.mark.asyncio
+@patch("client.logging.debug")
 @patch("client.logging.info")
-async def test_send_predicted_coordinates(mock_log_info):
+async def test_send_predicted_coordinates(mock_log_info, mock_log_debug):
     mock_channel = MagicMock()
     mock_channel.readyState = "open"
     mock_channel.send = MagicMock()
 
     class MockSharedCoordinates:
-        x = 10
-        y = 20
+        value = pack_coordinates(10, 20)
 
     shared_predicted_coordinates = MockSharedCoordinates()
     task = asyncio.create_task(
@@ -230,11 +445,38 @@ async def test_send_predicted_coordinates(mock_log_info):
     except asyncio.CancelledError:
         pass
 
-    mock_channel.send.assert_called_with(json.dumps((10, 20)))
-    mock_log_info.assert_any_call("Sending predicted ball coordinates: 10, 20")
+    mock_channel.send.assert_called_with(encode_coordinates(10, 20))
+    mock_log_debug.assert_any_call(
+        "Sending predicted ball coordinates: %d, %d", 10, 20
+    )
     mock_log_info.assert_any_call("Channel closed")
 
 
+@pytest.mark.asyncio
+async def test_send_predicted_coordinates_skips_unchanged_prediction():
+    mock_channel = MagicMock()
+    mock_channel.readyState = "open"
+    shared_predicted_coordinates = Mock(value=pack_coordinates(10, 20))
+
+    async def tick(_):
+        if tick.calls == 3:
+            shared_predicted_coordinates.value = pack_coordinates(11, 20)
+        if tick.calls == 5:
+            mock_channel.readyState = "closed"
+        tick.calls += 1
+
+    tick.calls = 0
+    with patch("client.asyncio.sleep", side_effect=tick):
+        await send_predicted_coordinates(
+            mock_channel, shared_predicted_coordinates, mock_channel
+        )
+
+    assert mock_channel.send.call_args_list == [
+        ((encode_coordinates(10, 20),),),
+        ((encode_coordinates(11, 20),),),
+    ]
+
+
 @pytest.mark.asyncio
 @patch("client.close_connection", new_callable=AsyncMock)
 @patch("client.logging.info")
@@ -266,7 +508,7 @@ async def test_cleanup(mock_log_info, mock_close_connection):
             ((mock_media_pc, mock_media_signaling),),
             ((mock_data_pc, mock_data_signaling),),
         ],
-        any_order=False,
+        any_order=True,
     )
 
 
@@ -338,7 +580,9 @@ async def test_run_client_success(
     )
 
     # Verify that all the setup and communication functions were called correctly
-    mock_setup_remote_track.assert_called_once_with(mock_media_pc, mock_input_frames_q)
+    mock_setup_remote_track.assert_called_once_with(
+        mock_media_pc, mock_input_frames_q, None
+    )
     mock_wait_for_offer_and_send_answer.assert_called_once_with(
         mock_media_pc, mock_media_signaling
     )
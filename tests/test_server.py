@@ -1,5 +1,6 @@
 import json
 import math
+import struct
 from unittest.mock import AsyncMock, patch
 
 import numpy as np
@@ -7,6 +8,7 @@ import pytest
 from aiortc import RTCPeerConnection
 
 from server import distance_between, on_message, run_server, setup_data_channel
+from utils import encode_coordinates
 
 
 def test_distance_between_coordinates():
@@ -32,6 +34,40 @@ def test_on_message_valid_coordinates(mock_info):
     )
 
 
+@patch("server.logging.info")
+def test_on_message_packed_coordinates(mock_info):
+    on_message(encode_coordinates(3, 4), (0, 0))
+
+    mock_info.assert_called_once_with("Prediction Error (distance): 5.0")
+
+
+@patch("server.logging.info")
+def test_on_message_packed_coordinates_far_from_actual(mock_info):
+    on_message(encode_coordinates(-32768, 0), (600, 0))
+
+    mock_info.assert_called_once_with("Prediction Error (distance): 33368.0")
+
+
+@patch("server.logging.info")
+def test_on_message_previous_packed_format(mock_info):
+    on_message(struct.pack("<ii", 3, 4), (0, 0))
+
+    mock_info.assert_called_once_with("Prediction Error (distance): 5.0")
+
+
+@patch("server.logging.error")
+def test_on_message_invalid_bytes(mock_error):
+    on_message(b"\x01\x02", np.array([0, 0]))
+    on_message(encode_coordinates(1, 2) * 3, np.array([0, 0]))
+    assert mock_error.call_count == 2
+
+
+@patch("server.logging.error")
+def test_on_message_wrong_number_of_coordinates(mock_error):
+    on_message(json.dumps([1, 2, 3]), (0, 0))
+    mock_error.assert_called_once()
+
+
 @patch("server.logging.error")
 def test_on_message_invalid_json(mock_error):
     invalid_message = "{not_valid_json}"
@@ -57,7 +93,7 @@ def test_setup_data_channel(
     message_handler = mock_channel.on.mock_calls[0][1][1]
     message_handler(test_message)
 
-    mock_on_message.assert_called_once_with(test_message, mock_track.coordinates)
+    mock_on_message.assert_called_once_with(test_message, mock_track.position)
 
 
 @pytest.mark.asyncio
@@ -0,0 +1,99 @@
+import multiprocessing as mp
+import queue
+
+import numpy as np
+import pytest
+
+from shared_frame_buffer import SharedFrameBuffer
+
+
+@pytest.fixture
+def frame_buffer():
+    buffer = SharedFrameBuffer((4, 6, 3))
+    yield buffer
+    buffer.close()
+
+
+def test_put_and_get_frame(frame_buffer):
+    frame = np.full((4, 6, 3), 7, dtype=np.uint8)
+
+    frame_buffer.put(frame)
+    result = frame_buffer.get(timeout=1)
+
+    assert np.array_equal(result, frame)
+
+
+def test_get_returns_latest_frame(frame_buffer):
+    for value in range(3):
+        frame_buffer.put(np.full((4, 6, 3), value, dtype=np.uint8))
+
+    result = frame_buffer.get(timeout=1)
+
+    assert np.all(result == 2)
+
+
+def test_put_alternates_buffers(frame_buffer):
+    frame_buffer.put(np.full((4, 6, 3), 1, dtype=np.uint8))
+    first = frame_buffer.get(timeout=1)
+    frame_buffer.put(np.full((4, 6, 3), 2, dtype=np.uint8))
+    second = frame_buffer.get(timeout=1)
+
+    assert np.all(first == 1)
+    assert np.all(second == 2)
+
+
+def test_get_raises_empty_on_timeout(frame_buffer):
+    with pytest.raises(queue.Empty):
+        frame_buffer.get(timeout=0.01)
+
+    frame_buffer.put(np.zeros((4, 6, 3), dtype=np.uint8))
+    frame_buffer.get(timeout=1)
+
+    with pytest.raises(queue.Empty):
+        frame_buffer.get(timeout=0.01)
+
+
+def test_put_none_stops_reader(frame_buffer):
+    frame_buffer.put(None)
+    assert frame_buffer.get(timeout=1) is None
+
+
+def test_put_rejects_mismatched_shape(frame_buffer):
+    with pytest.raises(ValueError):
+        frame_buffer.put(np.zeros((6, 4, 3), dtype=np.uint8))
+
+
+def test_frame_overwritten_after_two_more_frames(frame_buffer):
+    frame_buffer.put(np.zeros((4, 6, 3), dtype=np.uint8))
+    frame = frame_buffer.get(timeout=1)
+
+    frame_buffer.put(np.ones((4, 6, 3), dtype=np.uint8))
+    assert not frame_buffer.frame_overwritten()
+    assert np.all(frame == 0)
+
+    frame_buffer.put(np.ones((4, 6, 3), dtype=np.uint8))
+    assert frame_buffer.frame_overwritten()
+
+
+def test_frame_not_overwritten_after_new_get(frame_buffer):
+    for value in range(3):
+        frame_buffer.put(np.full((4, 6, 3), value, dtype=np.uint8))
+
+    frame_buffer.get(timeout=1)
+
+    assert not frame_buffer.frame_overwritten()
+
+
+def _read_sum(frame_buffer, result):
+    result.value = int(frame_buffer.get(timeout=5).sum())
+
+
+def test_frame_is_shared_with_child_process(frame_buffer):
+    result = mp.Value("q", -1)
+    process = mp.Process(target=_read_sum, args=(frame_buffer, result))
+    process.start()
+
+    frame_buffer.put(np.ones((4, 6, 3), dtype=np.uint8))
+    process.join(timeout=10)
+
+    assert result.value == 4 * 6 * 3
@@ -1,9 +1,12 @@
+import struct
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
 from utils import (
     close_connection,
+    decode_coordinates,
+    encode_coordinates,
     receive_offer_with_retry,
     send_offer_and_wait_for_answer,
     wait_for_offer_and_send_answer,
@@ -107,3 +110,40 @@ async def test_receive_offer_with_retry_failure(mock_signaling):
 
     with pytest.raises(ConnectionRefusedError, match="Connection refused"):
         await receive_offer_with_retry(mock_signaling, retries=1, delay=1)
+
+
+@pytest.mark.asyncio
+@patch("utils.random.random", return_value=0.5)
+@patch("utils.asyncio.sleep", new_callable=AsyncMock)
+async def test_receive_offer_with_retry_backs_off_exponentially(
+    mock_sleep, mock_random, mock_signaling
+):
+    mock_signaling.receive = AsyncMock(
+        side_effect=[ConnectionRefusedError()] * 5 + ["offer"]
+    )
+
+    offer = await receive_offer_with_retry(mock_signaling, delay=1, delay_max=5)
+
+    assert offer == "offer"
+    assert [c.args[0] for c in mock_sleep.await_args_list] == [1, 2, 4, 5, 5]
+
+
+def test_encode_and_decode_coordinates():
+    message = encode_coordinates(640, -1)
+
+    assert len(message) == 4
+    assert decode_coordinates(message) == (640, -1)
+
+
+def test_encode_coordinates_out_of_range():
+    with pytest.raises(struct.error):
+        encode_coordinates(1 << 15, 0)
+
+
+def test_decode_coordinates_previous_format():
+    assert decode_coordinates(struct.pack("<ii", 40000, -1)) == (40000, -1)
+
+
+def test_decode_coordinates_invalid_size():
+    with pytest.raises(struct.error):
+        decode_coordinates(b"\x01\x02")
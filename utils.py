@@ -1,10 +1,18 @@
 import logging
 import asyncio
+import random
+import struct
 from argparse import ArgumentParser
+from typing import Tuple
 
 from aiortc import RTCPeerConnection, RTCIceCandidate
 from aiortc.contrib.signaling import TcpSocketSignaling
 
+# Wire format of predicted ball coordinates on the data channel: x, y as little-endian int16
+COORDINATES_STRUCT = struct.Struct("<hh")
+# Previous wire format (x, y as little-endian int32), still decoded during the transition
+LEGACY_COORDINATES_STRUCT = struct.Struct("<ii")
+
 
 async def wait_for_offer_and_send_answer(
     pc: RTCPeerConnection, signaling: TcpSocketSignaling
@@ -81,21 +89,24 @@ async def close_connection(pc: RTCPeerConnection, signaling: TcpSocketSignaling)
         signaling: The signaling channel to be closed.
     """
     logging.info("Closing connections")
-    await pc.close()
-    await signaling.close()
+    await asyncio.gather(pc.close(), signaling.close())
 
 
 async def receive_offer_with_retry(
-    signaling: TcpSocketSignaling, retries: int = 20, delay: int = 1
+    signaling: TcpSocketSignaling,
+    retries: int = 20,
+    delay: float = 0.1,
+    delay_max: float = 5.0,
 ) -> object:
     """
     Attempts to receive an offer through the signaling mechanism, with a specified number of retries
-    and a delay between retries in case of connection refusal.
+    and an exponentially growing, jittered delay between retries in case of connection refusal.
 
     Args:
         signaling: The signaling object used to receive the offer.
         retries: The number of attempts to make before giving up.
-        delay: The delay between retry attempts in seconds.
+        delay: The delay before the first retry in seconds, doubled after every attempt.
+        delay_max: The maximum delay between retry attempts in seconds, before jitter.
 
     Returns:
         The received offer.
@@ -109,7 +120,8 @@ async def receive_offer_with_retry(
         except ConnectionRefusedError as e:
             logging.warning("Connection refused, retrying...")
             if attempt < retries - 1:
-                await asyncio.sleep(delay)
+                backoff = min(delay_max, delay * 2**attempt)
+                await asyncio.sleep(backoff * (0.5 + random.random()))
             else:
                 logging.error("Failed to receive offer after retries.")
                 raise e
@@ -130,3 +142,55 @@ def add_connection_arguments(parser: ArgumentParser) -> None:
     parser.add_argument(
         "--media_port", type=int, default=1235, help="Media channel port"
     )
+
+
+def add_frame_arguments(parser: ArgumentParser) -> None:
+    """
+    Configures an ArgumentParser with the dimensions of the streamed video frames, which
+    the server uses to render the track and the client uses to size its frame buffer.
+
+    Args:
+        parser: The ArgumentParser instance to which the arguments will be added.
+    """
+    parser.add_argument("--width", type=int, default=640, help="Frame width in pixels")
+    parser.add_argument(
+        "--height", type=int, default=480, help="Frame height in pixels"
+    )
+
+
+def encode_coordinates(x: int, y: int) -> bytes:
+    """
+    Packs ball coordinates into a data channel message.
+
+    Args:
+        x: The x coordinate in pixels.
+        y: The y coordinate in pixels.
+
+    Returns:
+        The packed coordinates.
+
+    Raises:
+        struct.error: If a coordinate does not fit in a signed 16-bit integer.
+    """
+    return COORDINATES_STRUCT.pack(x, y)
+
+
+def decode_coordinates(message: bytes) -> Tuple[int, int]:
+    """
+    Unpacks ball coordinates from a data channel message.
+
+    Messages in the previous 8-byte format are still accepted, so clients sending
+    int32 coordinates keep working while they are upgraded.
+
+    Args:
+        message: A message created by encode_coordinates, or in the previous format.
+
+    Returns:
+        The x and y coordinates in pixels.
+
+    Raises:
+        struct.error: If the message does not have the expected size.
+    """
+    if len(message) == LEGACY_COORDINATES_STRUCT.size:
+        return LEGACY_COORDINATES_STRUCT.unpack(message)
+    return COORDINATES_STRUCT.unpack(message)